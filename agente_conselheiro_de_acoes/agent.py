@@ -2,10 +2,56 @@ import json
 import math
 import os
 import sqlite3
-from datetime import datetime
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
 
 from mock_model import MockLSTM
 
+# Códigos das ações recomendadas pelo agente (gravados como INTEGER no banco)
+MANTER, COMPRAR, VENDER = 0, 1, 2
+# Nomes das ações, indexados pelo código (usados apenas para exibição)
+NOMES_ACOES = ("MANTER", "COMPRAR", "VENDER")
+# Janela (em dias) do cálculo da volatilidade: segunda a sexta, observação semanal
+VOL_WINDOW = 5
+# Quantidade de preços mais recentes lidos por "decide" (volatilidade e entrada do modelo)
+JANELA_HISTORICO = max(VOL_WINDOW, MockLSTM.window)
+
+
+def _decidir_acao(delta: float, threshold_base: float, volatility: float) -> int:
+    """
+    Núcleo numérico da decisão: compara a variação prevista com o threshold efetivo.
+
+    Função pura (apenas floats, sem I/O), separada de "decide" para manter o caminho
+    de cálculo executado a cada decisão enxuto e isolado do acesso ao banco de dados.
+
+    Parameters
+    ----------
+    delta : float
+        Variação entre o preço previsto e o preço atual
+    threshold_base : float
+        Limiar de ação definido na política do agente
+    volatility : float
+        Volatilidade recente do mercado de ações
+
+    Returns
+    -------
+    int
+        Código da ação recomendada (COMPRAR, VENDER ou MANTER)
+    """
+    # O Threshold efetivo é a política base + a sensibilidade da volatilidade
+    # Se o mercado varia 2% ao dia, exigir 1% é pouco. O agente se adapta.
+    meia_volatilidade = volatility * 0.5
+    threshold_efetivo = (
+        threshold_base if threshold_base > meia_volatilidade else meia_volatilidade
+    )
+
+    if delta > threshold_efetivo:
+        return COMPRAR
+    if delta < -threshold_efetivo:
+        return VENDER
+    return MANTER
+
 
 class AgenteConselheiroDeAcoes:
     """
@@ -16,32 +62,155 @@ class AgenteConselheiroDeAcoes:
     dinamicamente com base nos erros e acertos passados (Aprendizado Adaptativo).
 
     Attributes:
-        policy_file (str): Caminho para o arquivo de política do agente.
-        metrics_file (str): Caminho para o arquivo de métricas do agente.
+        policy_file (str | None): Caminho para o arquivo de política do agente (None: só em memória).
+        metrics_file (str | None): Caminho para o arquivo de métricas do agente (None: não é gravado).
         db_file (str): Caminho para o arquivo do banco de dados SQLite do agente.
         model (LSTM): Instância do modelo de previsão (LSTM) usado pelo agente.
         policy (dict[str, float]): Política carregada do arquivo de configuração.
+        pragma_synchronous (str): Nível de durabilidade do SQLite ("OFF", "NORMAL", "FULL" ou "EXTRA").
+        ephemeral (bool): Indica se o banco de dados é usado sem garantia de persistência.
+        last_volatility (float | None): Volatilidade calculada na última chamada de "decide".
     """
 
-    def __init__(self) -> None:
+    # SQL fixo das escritas, reaproveitado pelo cache de statements da conexão
+    _INSERT_SQL = """
+        INSERT INTO history (date, price_at_decision, predicted_price, action, threshold_used, volatility, learning_rate_used, real_return, outcome_evaluated)
+        VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, 0)
+    """
+    _UPDATE_SQL = "UPDATE history SET outcome_evaluated = 1, learning_rate_used = ?, real_return = ? WHERE id = ?"
+
+    def __init__(
+        self,
+        pragma_synchronous: str = "NORMAL",
+        db_file: str = "memory.db",
+        ephemeral: bool = False,
+        policy_file: str | None = None,
+        metrics_file: str | None = None,
+    ) -> None:
         """
         Inicializa o agente com arquivos de configuração, a LSTM e o banco de dados.
 
         Este método carrega os arquivos de configuração (política e métricas) e inicializa a LSTM
         e o banco de dados do agente. Caso os arquivos de configuração não existam, são criados com valores padrão.
+
+        Parameters
+        ----------
+        pragma_synchronous : str, default="NORMAL"
+            Valor do "PRAGMA synchronous" do SQLite. Com o journal em modo WAL, "NORMAL"
+            evita um fsync a cada COMMIT (a escrita vira um append sequencial no WAL);
+            em caso de queda de energia, apenas as últimas decisões podem ser perdidas,
+            mas o banco nunca fica corrompido. Use "FULL" para durabilidade máxima.
+            Valores aceitos: "OFF", "NORMAL", "FULL" ou "EXTRA".
+        db_file : str, default="memory.db"
+            Caminho para o banco de dados SQLite. ":memory:" mantém o histórico apenas
+            em memória, durante a execução (implica "ephemeral").
+        ephemeral : bool, default=False
+            Para simulações e testes com um banco próprio (ex: ":memory:" ou um arquivo
+            temporário), em que o histórico não precisa sobreviver à execução.
+            Mantém o journal em memória e desliga a sincronização com o disco
+            ("journal_mode=MEMORY", "synchronous=OFF"), eliminando o I/O de journaling.
+            Uma queda durante a execução pode corromper o banco.
+            Sem "policy_file"/"metrics_file" explícitos, a política (padrão) e as
+            métricas ficam apenas em memória: nenhum arquivo é lido ou gravado.
+        policy_file : str | None, default=None
+            Caminho para o arquivo de política do agente. Se None, usa "policy.json"
+            (ou nenhum arquivo, no modo "ephemeral").
+        metrics_file : str | None, default=None
+            Caminho para o arquivo de métricas do agente. Se None, usa "metrics.json"
+            (ou nenhum arquivo, no modo "ephemeral").
+
+        Com arquivos e banco próprios, vários agentes (ex: um por ativo) podem rodar
+        em paralelo, cada um em seu processo e com sua própria conexão SQLite.
+
+        Raises
+        ------
+        ValueError
+            Se "pragma_synchronous" não for um dos valores aceitos.
         """
-        self.policy_file = "policy.json"
-        self.metrics_file = "metrics.json"
-        self.db_file = "memory.db"
+        # O valor é interpolado no PRAGMA, então só os níveis conhecidos são aceitos
+        if pragma_synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(
+                f"pragma_synchronous inválido: '{pragma_synchronous}'. "
+                "Use 'OFF', 'NORMAL', 'FULL' ou 'EXTRA'."
+            )
+        self.db_file = db_file
+        self.pragma_synchronous = pragma_synchronous
+        self.ephemeral = ephemeral or db_file == ":memory:"
+        # No modo "ephemeral", política e métricas só vão para arquivos explícitos
+        if policy_file is None and not self.ephemeral:
+            policy_file = "policy.json"
+        if metrics_file is None and not self.ephemeral:
+            metrics_file = "metrics.json"
+        self.policy_file = policy_file
+        self.metrics_file = metrics_file
         self.model = MockLSTM()
+        self.last_volatility: float | None = None
+        # Arquivos (política/métricas) a gravar no COMMIT; None fora de "transaction"
+        self._gravacoes_adiadas: set[str] | None = None
         self.policy = self._load_policy()
+        # Conexão única reaproveitada por todas as operações do agente
+        self._conn = sqlite3.connect(
+            self.db_file, isolation_level=None, check_same_thread=False
+        )
         self._init_db()
+        self._metricas = self._carregar_metricas()
+
+    def close(self) -> None:
+        """
+        Fecha a conexão com o banco de dados ("db_file"), se ainda estiver aberta.
+        """
+        conn = getattr(self, "_conn", None)
+        if conn is not None:
+            conn.close()
+            self._conn = None
+
+    def __del__(self) -> None:
+        self.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Agrupa as escritas no banco de dados em uma única transação (BEGIN ... COMMIT).
+
+        Sem uma transação explícita, cada INSERT/UPDATE é confirmado individualmente.
+        Envolvendo um ciclo completo de "learn" e "decide" (ou vários, em um backtest),
+        todas as escritas são confirmadas de uma só vez. Chamadas aninhadas reaproveitam
+        a transação já aberta.
+
+        Os arquivos "policy_file" e "metrics_file" só são gravados depois do COMMIT.
+        Em caso de erro, a transação é desfeita e a política e os contadores de
+        desempenho em memória voltam ao estado do início da transação.
+        """
+        if self._gravacoes_adiadas is not None or self._conn.in_transaction:
+            yield
+            return
+
+        policy = dict(self.policy)
+        metricas = dict(self._metricas)
+        self._gravacoes_adiadas = set()
+        self._conn.execute("BEGIN")
+        try:
+            yield
+            self._conn.commit()
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            self.policy = policy
+            self._metricas = metricas
+            raise
+        finally:
+            gravacoes, self._gravacoes_adiadas = self._gravacoes_adiadas, None
+
+        if "policy" in gravacoes:
+            self._save_policy()
+        if "metrics" in gravacoes:
+            self._atualizar_metricas()
 
     def _load_policy(self) -> dict[str, float]:
         """
-        Carrega a política do agente a partir do arquivo "policy.json" (se existir).
+        Carrega a política do agente a partir do arquivo "policy_file" (se existir).
 
-        O "policy.json" contém os parâmetros necessários para o correto funcionamento do agente.
+        O "policy_file" (por padrão, "policy.json") contém os parâmetros necessários para o correto funcionamento do agente.
         Caso o arquivo não exista ainda, será criado um com os valores padrão:
         - threshold: 0.01 (Limite de variação de preço para realizar uma ação)
         - learning_rate: 0.05 (Taxa de aprendizado usada para ajustar o limiar de ação)
@@ -57,7 +226,7 @@ class AgenteConselheiroDeAcoes:
         - str: Nome da configuração
         - float: Valor da configuração
         """
-        if os.path.exists(self.policy_file):
+        if self.policy_file is not None and os.path.exists(self.policy_file):
             try:
                 with open(self.policy_file, "r") as f:
                     return json.load(f)
@@ -84,7 +253,7 @@ class AgenteConselheiroDeAcoes:
 
     def _save_policy(self, policy_data: dict[str, float] | None = None) -> None:
         """
-        Salva a política do agente no arquivo "policy.json".
+        Salva a política do agente no arquivo "policy_file".
 
         Se policy_data for fornecido, atualiza a política do agente com os dados fornecidos.
         Caso contrário, salva a política atual no arquivo.
@@ -99,40 +268,62 @@ class AgenteConselheiroDeAcoes:
         """
         if policy_data:
             self.policy = policy_data
+        if self.policy_file is None:
+            return  # Modo "ephemeral" sem arquivo: a política fica apenas em memória
         try:
+            # Serializa a política inteira de uma vez e grava com uma única escrita
+            # (json.dump escreveria no arquivo pedaço por pedaço)
             with open(self.policy_file, "w") as f:
-                json.dump(self.policy, f, indent=4)
+                f.write(json.dumps(self.policy, indent=4))
         except Exception as e:
             print(f"ERRO INESPERADO ao salvar política: {e}")
             raise
 
     def _init_db(self) -> None:
         """
-        Inicializa o banco de dados "memory.db" com a tabela "history".
+        Inicializa o banco de dados "db_file" com a tabela "history".
 
         Cria a tabela "history", se ela não existir ainda, com as seguintes colunas:
         - id: Identificador único da decisão (chave primária)
         - date: Data da decisão (formato "YYYY-MM-DD HH:MM:SS")
         - price_at_decision: Preço da ação no momento da decisão
         - predicted_price: Preço previsto pelo modelo
-        - action: Ação tomada pelo agente (COMPRAR, VENDER ou MANTER)
+        - action: Código da ação tomada pelo agente (MANTER = 0, COMPRAR = 1, VENDER = 2)
         - threshold_used: Limiar de segurança utilizado na decisão
         - volatility: Variação de preço no momento da decisão
         - learning_rate_used: Taxa de aprendizado no momento usada para ajustar o limiar do agente (threshold)
         - real_return: Retorno real da operação dada a decisão (ganho, perda ou nulo)
         - outcome_evaluated: Indica se a decisão foi avaliada ou não (1 para sim, 0 para não)
 
-        Se a tabela "history" já existir, completa o banco de dados.
+        Se a tabela "history" já existir, completa o banco de dados. Bancos criados por
+        versões anteriores, que guardavam a ação como texto, são convertidos uma única vez
+        para os códigos inteiros (controlado pelo "PRAGMA user_version").
+
+        Cria também o índice parcial "idx_hist_pending", que contém apenas as decisões
+        ainda não avaliadas (outcome_evaluated = 0) e as colunas lidas por "learn" e
+        "pending_decision". Assim, a busca da decisão pendente é respondida só pelo
+        índice, sem varrer nem consultar a tabela.
+
+        Também configura a conexão para usar o journal em modo WAL, com o nível de
+        sincronização definido em "pragma_synchronous", e tabelas temporárias em memória.
+        No modo "ephemeral", o journal fica em memória e a sincronização é desligada.
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
+        if self.ephemeral:
+            cursor.execute("PRAGMA journal_mode=MEMORY")
+            cursor.execute("PRAGMA synchronous=OFF")
+        else:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={self.pragma_synchronous}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB de cache de páginas
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 date TEXT,
                 price_at_decision REAL,
                 predicted_price REAL,
-                action TEXT,
+                action INTEGER,
                 threshold_used REAL,
                 volatility REAL, 
                 learning_rate_used REAL,
@@ -140,14 +331,26 @@ class AgenteConselheiroDeAcoes:
                 outcome_evaluated INTEGER DEFAULT 0
             )
         """)
-        conn.commit()
-        conn.close()
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_hist_pending
+            ON history(outcome_evaluated, id, action, price_at_decision, predicted_price)
+            WHERE outcome_evaluated = 0
+        """)
+
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] < 1:
+            cursor.execute("""
+                UPDATE history
+                SET action = CASE action WHEN 'COMPRAR' THEN 1 WHEN 'VENDER' THEN 2 ELSE 0 END
+                WHERE action IN ('MANTER', 'COMPRAR', 'VENDER')
+            """)
+            cursor.execute("PRAGMA user_version = 1")
 
     def _record_decision(
-        self, price: float, pred: float, action: str, vol: float
+        self, price: float, pred: float, action: int, vol: float
     ) -> None:
         """
-        Registra uma decisão tomada pelo agente no banco de dados "memory.db".
+        Registra uma decisão tomada pelo agente no banco de dados "db_file".
 
         Parameters
         ----------
@@ -155,20 +358,15 @@ class AgenteConselheiroDeAcoes:
             Preço da ação no momento da decisão
         pred : float
             Preço previsto pelo modelo
-        action : str
-            Ação tomada pelo agente (COMPRAR, VENDER ou MANTER)
+        action : int
+            Código da ação tomada pelo agente (COMPRAR, VENDER ou MANTER)
         vol : float
             Variação de preço no momento da decisão
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO history (date, price_at_decision, predicted_price, action, threshold_used, volatility, learning_rate_used, real_return, outcome_evaluated)
-            VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, 0)
-            """,
+        self._conn.execute(
+            self._INSERT_SQL,
             (
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                time.strftime("%Y-%m-%d %H:%M:%S"),
                 price,
                 pred,
                 action,
@@ -176,19 +374,20 @@ class AgenteConselheiroDeAcoes:
                 vol,
             ),
         )
-        conn.commit()
-        conn.close()
 
-    def _calcular_volatilidade(self, prices: list, window: int = 5) -> float:
+    def _calcular_volatilidade(
+        self, prices: Sequence[float], window: int = VOL_WINDOW
+    ) -> float:
         """
         Calcula a volatilidade dos últimos cinco dias da lista de preços históricos do mercado de ações.
 
         Parameters
         ----------
-        prices : list
-            Lista de preços históricos
-        window : int, default=5
-            Janela de observação para calcular a volatilidade (default=5, 5 dias, segunda a sexta, observação semanal)
+        prices : Sequence[float]
+            Preços históricos (lista ou buffer tipado, ex: array.array("d")). Apenas a
+            janela final é lida.
+        window : int, default=VOL_WINDOW
+            Janela de observação para calcular a volatilidade (VOL_WINDOW = 5, 5 dias, segunda a sexta, observação semanal)
 
         Returns
         -------
@@ -205,11 +404,79 @@ class AgenteConselheiroDeAcoes:
 
         return std_dev / avg
 
+    def _carregar_metricas(self) -> dict[str, float]:
+        """
+        Calcula os contadores de desempenho a partir das decisões já avaliadas no banco.
+
+        É executado apenas uma vez, na inicialização do agente. A partir daí, os contadores
+        são atualizados incrementalmente em "learn", sem reler o histórico inteiro.
+
+        Returns
+        -------
+        dict
+            [str, float]
+
+        Where:
+        - total: Número total de operações avaliadas (compras, vendas e manter)
+        - ativos: Número de trades ativos (compras e vendas)
+        - acertos: Número de trades ativos com retorno positivo
+        - lucro: Soma simples dos retornos dos trades ativos
+        """
+        # Agregação feita pelo próprio SQLite em uma única varredura (MANTER = 0 é neutro,
+        # fica fora do Win Rate e do lucro). CASE em vez de FILTER para SQLite < 3.30.
+        total, ativos, acertos, lucro = self._conn.execute("""
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN action != 0 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN action != 0 AND real_return > 0 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN action != 0 THEN real_return ELSE 0 END)
+            FROM history
+            WHERE outcome_evaluated = 1
+            """).fetchone()
+
+        # Sem linhas avaliadas, as somas vêm como NULL
+        return {
+            "total": total,
+            "ativos": ativos or 0,
+            "acertos": acertos or 0,
+            "lucro": lucro or 0.0,
+        }
+
+    @staticmethod
+    def _contabilizar_trade(
+        contadores: dict[str, float], action: int, ret: float
+    ) -> None:
+        """
+        Soma o resultado de um trade avaliado aos contadores de desempenho.
+
+        Parameters
+        ----------
+        contadores : dict[str, float]
+            Contadores de desempenho (ver "_carregar_metricas")
+        action : int
+            Código da ação avaliada (COMPRAR, VENDER ou MANTER)
+        ret : float
+            Retorno real da operação
+        """
+        contadores["total"] += 1
+        if action == MANTER:
+            return  # Ignorando trades com "MANTER" do Win Rate
+
+        contadores["ativos"] += 1
+        # Se o retorno foi positivo, conta como acerto (podendo ser compra ou venda)
+        if ret > 0:
+            contadores["acertos"] += 1
+
+        # Soma simples de porcentagem
+        contadores["lucro"] += ret
+
     def _atualizar_metricas(self) -> None:
         """
         Atualiza as métricas do agente, como a taxa de acerto (win rate) e o lucro acumulado estimado.
 
-        As métricas são salvas em um arquivo JSON chamado "metrics.json", com as seguintes chaves:
+        As métricas são calculadas a partir dos contadores mantidos em memória
+        (ver "_carregar_metricas") e salvas no arquivo JSON "metrics_file" (por padrão,
+        "metrics.json"), com as seguintes chaves:
         - ultima_atualizacao: Data e hora da última atualização nesse arquivo
         - total_operacoes_avaliadas: Número total de operações avaliadas (compras, vendas e manter)
         - trades_ativos: Número de trades ativos (compras e vendas)
@@ -217,57 +484,51 @@ class AgenteConselheiroDeAcoes:
         - lucro_acumulado_estimado: Lucro acumulado estimado do agente, em porcentagem
         - threshold_atual: Nível de exigência (threshold) atual do agente
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        # Pegando apenas trades já finalizados (avaliados) e que não foram "MANTER"
-        # (Consideramos que "MANTER" é neutro, lucro = 0)
-        cursor.execute(
-            "SELECT action, real_return FROM history WHERE outcome_evaluated = 1"
-        )
-        trades = cursor.fetchall()
-        conn.close()
-
-        total_trades = len(trades)
-        if total_trades == 0:
-            return  # Sem dados ainda
-
-        acertos = 0
-        lucro_acumulado_pct = 0.0
-
-        for action, ret in trades:
-            if action == "MANTER":
-                continue  # Ignorando trades com "MANTER" do Win Rate
-
-            # Se o retorno foi positivo, conta como acerto (podendo ser compra ou venda)
-            if ret > 0:
-                acertos += 1
-
-            # Soma simples de porcentagem
-            lucro_acumulado_pct += ret
+        total_trades = self._metricas["total"]
+        if total_trades == 0 or self.metrics_file is None:
+            return  # Sem dados ainda (ou modo "ephemeral" sem arquivo de métricas)
 
         # Win Rate (Taxa de Acerto)
-        # Filtra apenas compras e vendas para o Win Rate
-        trades_ativos = [t for t in trades if t[0] != "MANTER"]
-        win_rate = (acertos / len(trades_ativos)) if len(trades_ativos) > 0 else 0.0
+        # Considera apenas compras e vendas ("MANTER" é neutro, lucro = 0)
+        trades_ativos = self._metricas["ativos"]
+        win_rate = (
+            (self._metricas["acertos"] / trades_ativos) if trades_ativos > 0 else 0.0
+        )
 
         metrics = {
-            "ultima_atualizacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ultima_atualizacao": time.strftime("%Y-%m-%d %H:%M:%S"),
             "total_operacoes_avaliadas": total_trades,  # Compras, Vendas e Manter
-            "trades_ativos": len(trades_ativos),  # Compras e Vendas apenas
+            "trades_ativos": trades_ativos,  # Compras e Vendas apenas
             "taxa_de_acerto": round(
                 win_rate * 100, 2
             ),  # Taxa de acerto dos trades ativos (%)
-            "lucro_acumulado_estimado": round(lucro_acumulado_pct * 100, 2),  # (%)
+            "lucro_acumulado_estimado": round(self._metricas["lucro"] * 100, 2),  # (%)
             "threshold_atual": self.policy["threshold"],
         }
 
         try:
             with open(self.metrics_file, "w") as f:
-                json.dump(metrics, f, indent=4)
+                f.write(json.dumps(metrics, indent=4))
         except Exception as e:
             print(f"ERRO INESPERADO ao salvar métricas: {e}")
-            print("O arquivo 'metrics.json' não foi atualizado!")
+            print(f"O arquivo '{self.metrics_file}' não foi atualizado!")
+
+    def pending_decision(self) -> tuple[int, float] | None:
+        """
+        Busca a decisão mais antiga ainda não avaliada, usando a conexão do agente.
+
+        Returns
+        -------
+        tuple | None
+            (action, predicted_price) da decisão pendente, ou None se não houver.
+
+        Where:
+        - action (int): Código da ação recomendada (ver NOMES_ACOES)
+        - predicted_price (float): Preço previsto pelo modelo na decisão
+        """
+        return self._conn.execute(
+            "SELECT CAST(action AS INTEGER), predicted_price FROM history WHERE outcome_evaluated = 0 ORDER BY id ASC LIMIT 1"
+        ).fetchone()
 
     def learn(
         self, current_price_today: float
@@ -290,15 +551,11 @@ class AgenteConselheiroDeAcoes:
         float
             Variação real entre o preço de ontem e o preço de hoje
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, action, price_at_decision FROM history WHERE outcome_evaluated = 0 ORDER BY id DESC LIMIT 1"
-        )
-        last_trade = cursor.fetchone()
+        last_trade = self._conn.execute(
+            "SELECT id, CAST(action AS INTEGER), price_at_decision FROM history WHERE outcome_evaluated = 0 ORDER BY id DESC LIMIT 1"
+        ).fetchone()
 
         if not last_trade:
-            conn.close()
             return None, 0
 
         trade_id, action, price_yesterday = last_trade
@@ -306,9 +563,9 @@ class AgenteConselheiroDeAcoes:
 
         # Aposta do agente. Comprar achando que vai subir, vender achando que vai cair, manter se nenhuma das opções for verdadeira
         lucro_trade = 0.0
-        if action == "COMPRAR":
+        if action == COMPRAR:
             lucro_trade = variacao_real  # Ganha na subida (ou perde se cair)
-        elif action == "VENDER":
+        elif action == VENDER:
             lucro_trade = -variacao_real  # Ganha na queda (ou perde se subir)
         else:  # MANTER, não ganha nada (pode ter custo oportunidade)
             lucro_trade = 0.0
@@ -323,46 +580,58 @@ class AgenteConselheiroDeAcoes:
         adjusted = False  # Flag para ajuste de threshold
 
         # Lógica de Aprendizado
-        if (action == "COMPRAR" and variacao_real < 0) or (
-            action == "VENDER" and variacao_real > 0
+        if (action == COMPRAR and variacao_real < 0) or (
+            action == VENDER and variacao_real > 0
         ):
             self.policy["threshold"] *= 1 + dynamic_lr
             msg = f"Aumentou rigor (Erro  de recomendação). dynamic_lr usado: {dynamic_lr:.4f}"
             adjusted = True
 
-        elif action == "MANTER" and abs(variacao_real) > self.policy["threshold"]:
+        elif action == MANTER and abs(variacao_real) > self.policy["threshold"]:
             self.policy["threshold"] *= 1 - dynamic_lr
             msg = f"Diminuiu rigor (Perdeu Oportunidade). dynamic_lr usado: {dynamic_lr:.4f}"
             adjusted = True
 
         # Faixa de operação do threshold (0.02 a 5%)
         if adjusted:
-            self.policy["threshold"] = max(
-                self.policy["min_threshold"],
-                min(self.policy["max_threshold"], self.policy["threshold"]),
+            # Limita o threshold à faixa sem chamar min()/max() (comparações diretas)
+            threshold = self.policy["threshold"]
+            min_t = self.policy["min_threshold"]
+            max_t = self.policy["max_threshold"]
+            self.policy["threshold"] = (
+                min_t
+                if threshold < min_t
+                else max_t if threshold > max_t else threshold
             )
 
-        self._save_policy()
-
-        cursor.execute(
-            "UPDATE history SET outcome_evaluated = 1, learning_rate_used = ?, real_return = ? WHERE id = ?",
+        self._conn.execute(
+            self._UPDATE_SQL,
             (dynamic_lr, lucro_trade, trade_id),
         )
-        conn.commit()
-        conn.close()
-
-        self._atualizar_metricas()
+        self._contabilizar_trade(self._metricas, action, lucro_trade)
+
+        # Dentro de "transaction", os arquivos só são gravados após o COMMIT
+        if self._gravacoes_adiadas is not None:
+            if adjusted:
+                self._gravacoes_adiadas.add("policy")
+            self._gravacoes_adiadas.add("metrics")
+        else:
+            if adjusted:
+                # Só grava a política em disco quando ela realmente mudou
+                self._save_policy()
+            self._atualizar_metricas()
 
         return msg, variacao_real
 
-    def decide(self, market_history: list) -> tuple[str, float, float]:
+    def decide(self, market_history: Sequence[float]) -> tuple[int, float, float]:
         """
         Decide a recomendação (comprar, vender ou manter) com base nos dados do mercado.
 
         Parameters
         ----------
-        market_history : list
-            Lista de preços históricos do mercado de ações
+        market_history : Sequence[float]
+            Preços históricos do mercado de ações (lista ou buffer tipado, ex: array.array("d")).
+            Apenas os últimos JANELA_HISTORICO preços são usados.
 
         Returns
         -------
@@ -370,7 +639,7 @@ class AgenteConselheiroDeAcoes:
             (action, predicted_price, delta)
 
         Where:
-        - action (str): Ação tomada (comprar, vender ou manter)
+        - action (int): Código da ação tomada (MANTER, COMPRAR ou VENDER; ver NOMES_ACOES)
         - predicted_price (float): Preço previsto pelo modelo
         - delta (float): Variação entre o preço previsto e o preço atual
         """
@@ -379,18 +648,10 @@ class AgenteConselheiroDeAcoes:
 
         # Calcula volatilidade dos últimos cinco dias (semanal)
         volatility = self._calcular_volatilidade(market_history)
+        self.last_volatility = volatility
         delta = (predicted_price - current_price) / current_price
 
-        # O Threshold efetivo é a política base + a sensibilidade da volatilidade
-        # Se o mercado varia 2% ao dia, exigir 1% é pouco. O agente se adapta.
-        threshold_base = self.policy["threshold"]
-        threshold_efetivo = max(threshold_base, volatility * 0.5)
-
-        action = "MANTER"
-        if delta > threshold_efetivo:
-            action = "COMPRAR"
-        elif delta < -threshold_efetivo:
-            action = "VENDER"
+        action = _decidir_acao(delta, self.policy["threshold"], volatility)
 
         # Registra a decisão tomada pelo agente
         self._record_decision(current_price, predicted_price, action, volatility)
@@ -1,4 +1,5 @@
 import random
+from collections.abc import Sequence
 
 
 class MockLSTM:
@@ -7,15 +8,18 @@ class MockLSTM:
     Gera uma previsão com um pequeno erro aleatório para fins de teste (+-3%).
     """
 
-    def predict(self, history_data) -> float:
+    # Quantidade de preços mais recentes que o modelo recebe como entrada
+    window = 60
+
+    def predict(self, history_data: Sequence[float]) -> float:
         """
         Faz uma previsão com base nos dados históricos, com um erro aleatório de até 3%.
 
 
         Parameters
         ----------
-        history_data : list
-            Lista de preços históricos
+        history_data : Sequence[float]
+            Preços históricos (lista ou buffer tipado, ex: array.array("d"))
 
         Returns
         -------
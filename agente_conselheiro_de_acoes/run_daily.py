@@ -1,87 +1,243 @@
+import argparse
 import csv
+import io
 import os
-import sqlite3
 import sys
 import time
-
-# Importa a classe do arquivo agent.py
-from agent import AgenteConselheiroDeAcoes
+from array import array
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 
 CSV_FILE = "market_data.csv"
 DB_FILE = "memory.db"
+# Tamanho do trecho final do CSV lido quando só os últimos preços são necessários
+TAIL_BYTES = 64 * 1024
+# Marcadores de preço ausente no CSV, descartados sem tentar a conversão para float
+_PRECOS_AUSENTES = frozenset(("", "NA", "N/A", "null", "-"))
+# Pausa padrão (em segundos) entre as etapas da saída; 0 desliga as pausas
+DEMO_SLEEP = float(os.environ.get("AGENT_DEMO_SLEEP", "0"))
+# Linhas separadoras da saída, montadas uma única vez na importação
+BAR_EQ = "=" * 50
+BAR_DASH = "-" * 50
+BAR_LONG = "-" * 80
+
+# Arquivos gerados pelo agente e o aviso exibido ao final, se o arquivo existir
+_WARNINGS = (
+    (
+        "memory.db",
+        "--- Verifique o arquivo 'memory.db' para ver o histórico completo do agente  ---",
+    ),
+    (
+        "policy.json",
+        "--- Verifique o arquivo 'policy.json' para ver a política atual do agente ------",
+    ),
+    (
+        "metrics.json",
+        "--- Verifique o arquivo 'metrics.json' para ver o desempenho do agente ---------",
+    ),
+)
+
+
+def pausar(segundos: float) -> None:
+    """
+    Pausa a execução por alguns segundos para facilitar a leitura da saída.
+
+    Parameters
+    ----------
+    segundos : float
+        Tempo de pausa em segundos. Se for 0 (padrão), não pausa.
+    """
+    if segundos > 0:
+        sys.stdout.flush()  # Exibe a etapa atual antes de pausar
+        time.sleep(segundos)
 
 
-def print_warning(path: str) -> None:
+@contextmanager
+def saida_em_blocos() -> Iterator[None]:
+    """
+    Desliga o flush a cada linha do stdout enquanto o contexto estiver ativo.
+
+    No terminal (ou com PYTHONUNBUFFERED, comum em containers), o stdout do Python
+    escreve a cada "print". Com o buffer de linha e o "write_through" desligados, as
+    linhas de uma etapa são escritas de uma só vez: nas pausas (ver "pausar") ou ao
+    final da execução, quando o estado original é restaurado.
     """
-    Imprime uma mensagem de aviso para o usuário se o arquivo especificado existir.
+    stdout = sys.stdout
+    if not isinstance(stdout, io.TextIOWrapper):
+        yield
+        return
+
+    line_buffering = stdout.line_buffering
+    write_through = stdout.write_through
+    stdout.reconfigure(line_buffering=False, write_through=False)
+    try:
+        yield
+    finally:
+        stdout.flush()
+        stdout.reconfigure(line_buffering=line_buffering, write_through=write_through)
+
+
+def _extrair_precos(linhas: Iterable[list[str]]) -> array:
+    """
+    Converte a coluna 1 (Preço) das linhas do CSV em floats.
+
+    Os preços são acumulados direto em um array.array("d") (8 bytes por preço), sem
+    montar antes uma lista de objetos float. Células de preço vazias ou marcadas como
+    ausentes (ver _PRECOS_AUSENTES) são puladas com uma consulta a um conjunto, sem
+    lançar e capturar uma exceção; o try/except fica só para os erros de formatação.
 
     Parameters
     ----------
-    path : str
-        Caminho do arquivo a ser verificado.
+    linhas : Iterable[list[str]]
+        Linhas do CSV já separadas em colunas (sem o cabeçalho).
 
     Returns
     -------
-    None
+    array
+        Preços das linhas válidas, na ordem do arquivo.
     """
-    if os.path.exists(path) and path == "memory.db":
-        print(
-            "--- Verifique o arquivo 'memory.db' para ver o histórico completo do agente  ---"
-        )
-    if os.path.exists(path) and path == "policy.json":
-        print(
-            "--- Verifique o arquivo 'policy.json' para ver a política atual do agente ------"
-        )
-    if os.path.exists(path) and path == "metrics.json":
-        print(
-            "--- Verifique o arquivo 'metrics.json' para ver o desempenho do agente ---------"
-        )
-
-
-def csv_read(caminho_arquivo: str) -> tuple[list[float], str]:
+    precos = array("d")
+    for row in linhas:
+        if not row:
+            continue  # Evita linhas vazias
+
+        # Pega a coluna 1 (Preço) e converte para float
+        valor = row[1]
+        if valor in _PRECOS_AUSENTES:
+            continue  # Pula linhas sem preço
+        try:
+            precos.append(float(valor))
+        except ValueError:
+            continue  # Pula linhas com erro de formatação
+    return precos
+
+
+def _ler_fim_csv(
+    caminho_arquivo: str, tamanho: int, n_tail: int
+) -> tuple[array, str] | None:
+    """
+    Lê apenas o cabeçalho e o trecho final (TAIL_BYTES) do CSV.
+
+    Evita processar o histórico inteiro quando só os últimos preços são necessários.
+
+    Parameters
+    ----------
+    caminho_arquivo : str
+        Caminho do arquivo CSV.
+    tamanho : int
+        Tamanho do arquivo CSV em bytes.
+    n_tail : int
+        Quantidade de preços (os mais recentes) necessária.
+
+    Returns
+    -------
+    tuple[array, str] | None
+        (últimos preços, nome da ação), ou None se o arquivo for pequeno, se o trecho
+        final não tiver "n_tail" preços ou se houver erro; nesses casos o CSV deve ser
+        lido por completo.
+    """
+    try:
+        with open(caminho_arquivo, mode="rb") as f:
+            cabecalho = f.readline()
+            inicio = tamanho - TAIL_BYTES
+            if inicio <= f.tell():
+                return None  # Arquivo pequeno: a leitura completa já é barata
+
+            f.seek(inicio)
+            bloco = f.read()
+
+        # A primeira linha do trecho provavelmente foi cortada no meio; é descartada
+        bloco = bloco[bloco.find(b"\n") + 1 :]
+
+        header = next(csv.reader([cabecalho.decode("utf-8")]), None)
+        if not header:
+            return None
+        nome_da_acao = header[1] if len(header) > 1 else "Desconhecida"
+
+        precos = _extrair_precos(csv.reader(bloco.decode("utf-8").splitlines()))
+    except (OSError, ValueError, IndexError, csv.Error):
+        return None
+
+    if len(precos) < n_tail:
+        return None
+    return precos[-n_tail:], nome_da_acao
+
+
+def _verificar_csv(caminho_arquivo: str) -> os.stat_result:
+    """
+    Confere se o arquivo CSV existe e não está vazio, encerrando a execução se não.
+
+    Parameters
+    ----------
+    caminho_arquivo : str
+        Caminho do arquivo CSV.
+
+    Returns
+    -------
+    os.stat_result
+        Informações do arquivo (ex: tamanho em bytes).
+    """
+    try:
+        stat = os.stat(caminho_arquivo)
+    except FileNotFoundError:
+        print(f"ERRO CRÍTICO: O arquivo '{caminho_arquivo}' não foi encontrado.")
+        sys.exit(1)
+
+    if stat.st_size == 0:
+        print("ERRO: Arquivo CSV vazio.")
+        sys.exit(1)
+    return stat
+
+
+def csv_read(caminho_arquivo: str, n_tail: int | None = None) -> tuple[array, str]:
     """
     Lê o arquivo CSV e retorna uma tupla contendo:
-    - uma lista com todo o histórico de preços (floats).
+    - um array.array("d") com todo o histórico de preços (floats contíguos em memória,
+      8 bytes por preço, sem um objeto float Python para cada elemento).
     - o nome da ação (string) extraído do cabeçalho.
 
     Os dados serão fatiados conforme necessário.
     Ignora a primeira linha (cabeçalho) e a coluna de datas.
+
+    Se "n_tail" for informado, retorna apenas os últimos "n_tail" preços, lendo só o
+    cabeçalho e o final do arquivo (o CSV inteiro só é processado se o final não
+    tiver preços suficientes).
     """
-    if not os.path.exists(caminho_arquivo):
-        print(f"ERRO CRÍTICO: O arquivo '{caminho_arquivo}' não foi encontrado.")
-        sys.exit(1)
+    stat = _verificar_csv(caminho_arquivo)
 
-    precos = []
-    nome_da_acao = "Desconhecida"
+    if n_tail is not None:
+        do_fim = _ler_fim_csv(caminho_arquivo, stat.st_size, n_tail)
+        if do_fim is not None:
+            return do_fim
 
     try:
-        with open(caminho_arquivo, mode="r", newline="", encoding="utf-8") as f:
+        # Buffer de 1 MiB (o padrão é 8 KiB): menos chamadas read() em arquivos grandes
+        with open(
+            caminho_arquivo,
+            mode="r",
+            newline="",
+            encoding="utf-8",
+            buffering=1 << 20,
+        ) as f:
             reader = csv.reader(f)
 
-            try:
-                header = next(reader)
-                if len(header) > 1:
-                    nome_da_acao = header[1]
-            except StopIteration:
+            header = next(reader, None)
+            if header is None:
                 print("ERRO: Arquivo CSV vazio.")
                 sys.exit(1)
+            nome_da_acao = header[1] if len(header) > 1 else "Desconhecida"
 
-            for row in reader:
-                if row:  # Evita linhas vazias
-                    try:
-                        # Pega a coluna 1 (Preço) e converte para float
-                        valor = float(row[1])
-                        precos.append(valor)
-                    except ValueError:
-                        continue  # Pula linhas com erro de formatação
+            precos = _extrair_precos(reader)
     except Exception as e:
         print(f"Erro ao ler CSV: {e}")
         sys.exit(1)
 
+    if n_tail is not None:
+        return precos[-n_tail:], nome_da_acao
     return precos, nome_da_acao
 
 
-def main() -> None:
+def main(pace: float = DEMO_SLEEP) -> None:
     """
     Executa o agente de ações.
 
@@ -97,59 +253,86 @@ def main() -> None:
 
     O agente decide para amanhã com novo limiar já ajustado.
 
-    O agente executa a decisão com base no histórico completo. O agente, usando
-    o modelo LSTM disponível, vai decidir quantos dias usar (ex: os últimos 5
-    para volatilidade, os últimos 60 para LSTM).
+    O agente executa a decisão com base nos preços mais recentes. É o agente, com
+    o modelo LSTM disponível, que define quantos dias são necessários
+    (JANELA_HISTORICO, ex: os últimos 5 para volatilidade, os últimos 60 para
+    LSTM); só esse trecho final do CSV é lido.
+
+    Parameters
+    ----------
+    pace : float, default=DEMO_SLEEP
+        Pausa (em segundos) entre as etapas da saída, para leitura interativa.
+        Por padrão não há pausas, a menos que a variável de ambiente
+        "AGENT_DEMO_SLEEP" esteja definida.
     """
     print("\n--- EXECUTANDO AGENTE CONSELHEIRO DE AÇÕES ---\n")
 
     print(f"Lendo arquivo '{CSV_FILE}'...")
-    market_history, nome_da_acao = csv_read(CSV_FILE)
+    # CSV ausente ou vazio encerra a execução antes de carregar o agente (e o modelo)
+    _verificar_csv(CSV_FILE)
+
+    # Importa a classe do arquivo agent.py só agora: é o agente que define quantos
+    # preços recentes precisam ser lidos
+    from agent import (
+        JANELA_HISTORICO,
+        MANTER,
+        NOMES_ACOES,
+        VOL_WINDOW,
+        AgenteConselheiroDeAcoes,
+    )
+
+    # O agente só usa os preços mais recentes (volatilidade e entrada da LSTM)
+    market_history, nome_da_acao = csv_read(CSV_FILE, n_tail=JANELA_HISTORICO)
     print(f"Ativo Identificado: '{nome_da_acao}'")
-    time.sleep(5)
+    pausar(pace)
 
-    if len(market_history) < 5:
-        print("ERRO: Histórico insuficiente (mínimo 5 dias).")
+    if len(market_history) < VOL_WINDOW:
+        print(f"ERRO: Histórico insuficiente (mínimo {VOL_WINDOW} dias).")
         return
 
     preco_ontem = market_history[-2]
     # Recebimento do novo preço de fechamento do mercado HOJE
     preco_hoje = market_history[-1]
 
-    print(f"\n{'=' * 50}")
+    print(f"\n{BAR_EQ}")
     print(f">>> Preço de fechamento do dia anterior: ${preco_ontem:.2f}")
-    # print(f"{'=' * 50}")
+    # print(BAR_EQ)
     print(f">>> Preço de fechamento do mercado HOJE: ${preco_hoje:.2f}")
-    print(f"{'=' * 50}")
+    print(BAR_EQ)
     print()
-    time.sleep(5)
+    pausar(pace)
 
     # Instancia o agente
-    agente = AgenteConselheiroDeAcoes()
+    agente = AgenteConselheiroDeAcoes(db_file=DB_FILE)
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT action, predicted_price FROM history WHERE outcome_evaluated = 0 ORDER BY id ASC LIMIT 1"
-    )
-    last_trade = cursor.fetchone()
-    conn.close()
+    # Consulta feita pela mesma conexão do agente (sem abrir o banco uma segunda vez)
+    last_trade = agente.pending_decision()
 
     if last_trade:
         last_action, last_pred = last_trade
-        print(f"   - No dia anterior, o Agente recomendou: {last_action}")
+        print(f"   - No dia anterior, o Agente recomendou: {NOMES_ACOES[last_action]}")
         print(f"   - Ele esperava que o preço fosse para ${last_pred:.2f}")
     else:
         print("   - Ainda não houve um trade.")
 
-    time.sleep(5)
+    pausar(pace)
     # Agente aprende com o que aconteceu de ontem pra hoje
     print("\n[APRENDIZADO DO AGENTE COM BASE NO PASSADO]\n")
-    time.sleep(5)
-
-    # O agente verifica se tinha alguma recomendação pendente e usa o preço de hoje
-    # para saber se acertou ou errou.
-    msg_aprendizado, var_real = agente.learn(preco_hoje)
+    pausar(pace)
+
+    # Aprendizado e nova decisão são gravados no banco em uma única transação.
+    # A saída é exibida só depois do COMMIT, para não manter o banco bloqueado
+    # durante as pausas.
+    with agente.transaction():
+        # O agente verifica se tinha alguma recomendação pendente e usa o preço de hoje
+        # para saber se acertou ou errou.
+        msg_aprendizado, var_real = agente.learn(preco_hoje)
+        # Threshold já ajustado pelo aprendizado (o decide não o altera)
+        threshold_atual = agente.policy["threshold"]
+
+        # Agente decide para amanhã com novo limiar já ajustado, a partir dos últimos
+        # JANELA_HISTORICO preços (ex: 5 para volatilidade, 60 para LSTM)
+        acao, preco_previsto, delta_previsto = agente.decide(market_history)
 
     if msg_aprendizado:
         # Se houve ajuste, mostramos o feedback
@@ -158,31 +341,25 @@ def main() -> None:
         print(f"   - Ajuste do agente: {msg_aprendizado}")
         if msg_aprendizado == "Mantendo rigor. Nenhuma oportunidade encontrada.":
             print(
-                f"   - Nível de Exigência mantido (Threshold): {agente.policy['threshold'] * 100:.4f}%"
+                f"   - Nível de Exigência mantido (Threshold): {threshold_atual * 100:.4f}%"
             )
         else:
             print(
-                f"   - Novo Nível de Exigência (Threshold): {agente.policy['threshold'] * 100:.4f}%"
+                f"   - Novo Nível de Exigência (Threshold): {threshold_atual * 100:.4f}%"
             )
     else:
         # Se não houve trade ou decisão pendente
         print("   - Nenhuma operação pendente de avaliação.")
 
-    time.sleep(5)
+    pausar(pace)
     print()
-    print("-" * 50)
+    print(BAR_DASH)
     print()
-    # Agente decide para amanhã com novo limiar já ajustado
-    # Passamos o histórico completo. O agente, usando o modelo LSTM disponível,
-    # vai decidir quantos dias usar (ex: os últimos 5 para volatilidade, os últimos 60 para LSTM).
     print("[PRÓXIMA ANÁLISE DO AGENTE]\n")
-    time.sleep(5)
-
-    # Executa a decisão
-    acao, preco_previsto, delta_previsto = agente.decide(market_history)
+    pausar(pace)
 
-    # Recalculamos a volatilidade aqui só para exibir ao usuário o que o agente viu internamente
-    volatilidade_atual = agente._calcular_volatilidade(market_history)
+    # Volatilidade que o agente calculou internamente no decide, só para exibir ao usuário
+    volatilidade_atual = agente.last_volatility
 
     # Exibe os dados que o "cérebro" do agente processou
     print(f"   - Volatilidade Recente (Risco): {volatilidade_atual * 100:.2f}%")
@@ -190,22 +367,21 @@ def main() -> None:
     print(f"   - Variação Esperada (Delta):   {delta_previsto * 100:.2f}%")
 
     print("\nGerando recomendação...")
-    time.sleep(10)
+    pausar(pace * 2)
 
     # Conclusão final
-    indicador = acao
+    indicador = NOMES_ACOES[acao]
 
     print()
-    print("-" * 50)
+    print(BAR_DASH)
     print()
     print(f"   => DECISÃO FINAL DO AGENTE PARA HOJE: {indicador}")
 
-    threshold_atual = agente.policy["threshold"]
     # Como o agente usa um "Threshold Efetivo" (com volatilidade) dentro do decide,
     # vamos estimar se foi a volatilidade ou a política que segurou o trade
     motivo = "Aguardando oportunidade clara."
 
-    if acao != "MANTER":
+    if acao != MANTER:
         motivo = f"Variação de {delta_previsto * 100:.2f}% supera o risco."
     elif abs(delta_previsto) > threshold_atual:
         motivo = "Sinal existe, mas volatilidade alta forçou cautela."
@@ -216,12 +392,24 @@ def main() -> None:
 
     print("\n--- FIM DA EXECUÇÃO DO AGENTE CONSELHEIRO DE AÇÕES ---\n")
 
-    print("-" * 80)
-    print_warning("memory.db")
-    print_warning("policy.json")
-    print_warning("metrics.json")
-    print("-" * 80)
+    print(BAR_LONG)
+    # Uma única leitura do diretório em vez de um stat() por arquivo
+    existentes = {entrada.name for entrada in os.scandir(".")}
+    for path, aviso in _WARNINGS:
+        if path in existentes:
+            print(aviso)
+    print(BAR_LONG)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Agente Conselheiro de Ações")
+    parser.add_argument(
+        "--pace",
+        type=float,
+        default=DEMO_SLEEP,
+        help="Pausa (em segundos) entre as etapas da saída, para leitura interativa "
+        "(padrão: $AGENT_DEMO_SLEEP ou 0)",
+    )
+    args = parser.parse_args()
+    with saida_em_blocos():
+        main(pace=args.pace)